@@ -1,11 +1,16 @@
 # Import Libraries
 import os
-import secrets
+import re
+import shutil
+import time
 # นำเข้า URL สำหรับการแยกส่วน URL ของฐานข้อมูล
 from urllib.parse import urlparse 
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, abort
+from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, abort, session
+from flask_caching import Cache
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.utils import secure_filename
+from sqlalchemy import func, insert, inspect as sa_inspect
+from sqlalchemy.orm import selectinload, joinedload, raiseload, validates
+from werkzeug.utils import secure_filename, safe_join
 from datetime import datetime
 
 # --- Configuration ---
@@ -24,6 +29,13 @@ if os.environ.get("DATABASE_URL"):
     app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_DIR', 'student_submissions')
     # ต้องใช้ Gunicorn ในการทำงานจริง ดังนั้นต้องใช้ Environment Variable
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'default_fallback_secret_key_for_prod')
+    # ตั้งค่า Connection Pool สำหรับ Postgres บน Render (pre_ping ป้องกัน connection ที่ค้าง/หมดอายุ)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('SQLALCHEMY_POOL_SIZE', 30)),
+        'max_overflow': int(os.environ.get('SQLALCHEMY_MAX_OVERFLOW', 10)),
+        'pool_recycle': int(os.environ.get('SQLALCHEMY_POOL_RECYCLE', 3600)),
+        'pool_pre_ping': True,
+    }
 else:
     # สำหรับการทดสอบบนเครื่อง Localhost (ใช้ SQLite)
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///submission_project_prod.db' 
@@ -32,8 +44,30 @@ else:
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# ให้ Web Server ด้านหน้า (เช่น Nginx) ส่งไฟล์แทน Python ผ่าน X-Sendfile
+# เปิดใช้เฉพาะเมื่อ Proxy รองรับเท่านั้น (USE_X_SENDFILE=1) มิฉะนั้นผู้ใช้จะได้ไฟล์เปล่า
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+
+# สร้างโฟลเดอร์เก็บไฟล์ครั้งเดียวตอนเริ่มแอป (ไม่ต้องตรวจสอบซ้ำทุกครั้งที่มีการส่งงาน)
+os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
 db = SQLAlchemy(app)
 
+# ตั้งค่า Cache สำหรับผลลัพธ์ของหน้าเว็บ: ค่าเริ่มต้นคือ SimpleCache (แยกตาม worker)
+# กำหนด CACHE_TYPE=RedisCache และ CACHE_REDIS_URL เพื่อแชร์ Cache ระหว่าง worker (และเปิด Cache หน้า Dashboard ครู)
+# ในโหมด debug จะปิด Cache (NullCache) เพื่อให้เห็นการเปลี่ยนแปลงทันที
+app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'NullCache' if app.debug else 'SimpleCache')
+app.config['CACHE_NO_NULL_WARNING'] = True
+if os.environ.get('CACHE_REDIS_URL'):
+    app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL')
+cache = Cache(app)
+
+# SimpleCache/NullCache เก็บข้อมูลแยกในแต่ละ process: การล้าง Cache ใน worker หนึ่งจะไม่มีผลกับ worker อื่น
+# หน้า Dashboard ครูจึงถูกเก็บลง Cache เฉพาะเมื่อใช้ Cache ที่แชร์ร่วมกันได้ (เช่น RedisCache)
+SHARED_CACHE = app.config['CACHE_TYPE'].rsplit('.', 1)[-1].lower() not in ('simplecache', 'simple', 'nullcache', 'null')
+
+DASHBOARD_CACHE_KEY = 'view/teacher_dashboard'
+
 # --- Database Models (ไม่ต้องเปลี่ยน) ---
 
 class Class(db.Model):
@@ -41,8 +75,13 @@ class Class(db.Model):
     name = db.Column(db.String(100), nullable=False)
     # คอลัมน์ teacher_id ต้องมีอยู่เพื่อไม่ให้เกิด OperationalError (ถูกเพิ่มแล้ว)
     teacher_id = db.Column(db.String(100), default='default_teacher')
-    join_code = db.Column(db.String(10), unique=True, nullable=False)
-    assignments = db.relationship('Assignment', backref='class_rel', lazy=True, cascade='all, delete-orphan') 
+    join_code = db.Column(db.String(10), unique=True, nullable=False, index=True)
+    assignments = db.relationship('Assignment', back_populates='class_rel', lazy=True, cascade='all, delete-orphan') 
+
+    @validates('join_code')
+    def _normalize_join_code(self, key, value):
+        """เก็บรหัสเข้าร่วมเป็นตัวพิมพ์ใหญ่เสมอ ให้ตรงกับรูปแบบที่ใช้ค้นหาและใช้ Index ได้"""
+        return value.upper()
 
 class Assignment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -51,20 +90,127 @@ class Assignment(db.Model):
     file_link = db.Column(db.String(500), nullable=True) 
     max_score = db.Column(db.Integer, default=100)
     due_date = db.Column(db.DateTime, nullable=True)
-    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
-    submissions = db.relationship('Submission', backref='assignment_rel', lazy=True, cascade='all, delete-orphan')
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False, index=True)
+    class_rel = db.relationship('Class', back_populates='assignments')
+    submissions = db.relationship('Submission', back_populates='assignment_rel', lazy=True, cascade='all, delete-orphan')
 
 class Submission(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_name = db.Column(db.String(100), nullable=False)
     filename = db.Column(db.String(200), nullable=False)
-    submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # ให้ฐานข้อมูลกำหนดเวลาส่งเอง (ไม่ต้องส่งค่าจาก Python และใช้นาฬิกาเดียวกันทุก worker)
+    # default=func.now() ใส่ now() ลงในคำสั่ง INSERT โดยตรง จึงใช้ได้กับตารางเดิมที่ไม่มี default ฝั่งฐานข้อมูล
+    submitted_at = db.Column(db.DateTime(timezone=True), default=func.now(), server_default=func.now(), nullable=False)
     score = db.Column(db.Integer, nullable=True)
-    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False, index=True)
+    # ใช้ lazy='select' (ค่าเริ่มต้น) เพราะ many-to-one จะดึงจาก identity map ได้โดยไม่ต้อง query
+    assignment_rel = db.relationship('Assignment', back_populates='submissions')
+
+
+# --- Query Helpers ---
+
+def strict(query, *loads):
+    """ใส่ loader options ให้ query และเมื่ออยู่ในโหมด debug จะเพิ่ม raiseload('*')
+    เพื่อให้การ lazy load ที่ไม่ได้ตั้งใจ (N+1 query) แจ้งข้อผิดพลาดทันที"""
+    if app.debug:
+        return query.options(*loads, raiseload('*'))
+    return query.options(*loads)
+
+
+# แคชรหัสเข้าร่วม -> ข้อมูลชั้นเรียน (id, name, join_code) ภายใน process เพื่อลดการ query ซ้ำ
+JOIN_CODE_CACHE_TTL = 60  # วินาที
+JOIN_CODE_CACHE_SIZE = 1024
+_join_code_cache = {}
+
+
+def lookup_class_by_join_code(join_code):
+    """คืนค่าข้อมูลชั้นเรียน (id, name, join_code) จากรหัสเข้าร่วม โดยใช้แคชก่อนหากยังไม่หมดอายุ"""
+    now = time.monotonic()
+    entry = _join_code_cache.get(join_code)
+    if entry and entry[1] > now:
+        return entry[0]
+
+    class_row = db.session.query(Class.id, Class.name, Class.join_code).filter_by(join_code=join_code).first()
+    if class_row is not None:
+        if len(_join_code_cache) >= JOIN_CODE_CACHE_SIZE:
+            _join_code_cache.clear()
+        _join_code_cache[join_code] = (class_row, now + JOIN_CODE_CACHE_TTL)
+    return class_row
+
+
+def has_pending_flashes():
+    """ตรวจสอบว่ามีข้อความ flash รอแสดงหรือไม่ (หน้าที่มีข้อความ flash ต้องไม่ถูกเก็บลง Cache)"""
+    return '_flashes' in session
+
+
+def skip_dashboard_cache():
+    """ไม่ใช้ Cache กับหน้า Dashboard เมื่อไม่มี Cache ที่แชร์ระหว่าง worker หรือมีข้อความ flash รอแสดง"""
+    return not SHARED_CACHE or has_pending_flashes()
+
+
+def invalidate_dashboard():
+    """ล้าง Cache ของหน้า Dashboard ครู เมื่อชั้นเรียน งานมอบหมาย หรือจำนวนงานที่ส่งเปลี่ยนแปลง"""
+    cache.delete(DASHBOARD_CACHE_KEY)
+
+
+# --- File Helpers ---
+
+# อักขระที่ไม่อนุญาตในส่วนชื่อนักเรียนของชื่อไฟล์ (คอมไพล์ไว้ครั้งเดียวตอนโหลดโมดูล)
+_UNSAFE_NAME_CHARS = re.compile(r'[^A-Za-z0-9_-]+')
+
+
+def sanitize_name(name):
+    """แปลงชื่อนักเรียนให้ปลอดภัยสำหรับใช้เป็นส่วนหนึ่งของชื่อไฟล์ (สูงสุด 20 ตัวอักษร)"""
+    return _UNSAFE_NAME_CHARS.sub('_', name).strip('_')[:20]
+
+
+def save_upload(file, filepath):
+    """บันทึกไฟล์ที่อัปโหลดลงดิสก์
+    หากไฟล์ถูกพักไว้เป็นไฟล์ชั่วคราวจริง (ไฟล์ขนาดใหญ่) จะใช้ os.sendfile ให้ kernel คัดลอกโดยตรง
+    ไฟล์เล็กที่อยู่ในหน่วยความจำ (BytesIO) จะเขียนทั้งก้อนในครั้งเดียว
+    กรณีอื่นจะคัดลอกด้วย buffer ขนาด 1 MiB"""
+    with open(filepath, 'wb') as dst:
+        try:
+            src_fd = file.stream.fileno()
+            size = os.fstat(src_fd).st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(dst.fileno(), src_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except (AttributeError, OSError, ValueError):
+            # stream ไม่มี file descriptor หรือระบบไม่รองรับ sendfile
+            dst.seek(0)
+            dst.truncate()
+            if hasattr(file.stream, 'getbuffer'):
+                dst.write(file.stream.getbuffer())
+            else:
+                file.stream.seek(0)
+                shutil.copyfileobj(file.stream, dst, length=1 << 20)
 
 
 # --- Setup Function ---
 
+def create_indexes():
+    """สร้าง Index ที่ประกาศไว้ใน Model หากยังไม่มี (db.create_all ไม่เพิ่ม Index ให้ตารางที่มีอยู่แล้ว)
+    ถูกเรียกจาก setup_db และจาก hook on_starting ของ Gunicorn (gunicorn.conf.py)"""
+    inspector = sa_inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        # ตารางเดิมที่สร้างด้วย unique=True มี Unique Constraint (ซึ่งเป็น B-tree index อยู่แล้ว)
+        # จึงไม่ต้องสร้าง Unique Index ซ้ำบนคอลัมน์เดียวกัน
+        unique_columns = {tuple(uc['column_names']) for uc in inspector.get_unique_constraints(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            if index.unique and tuple(column.name for column in index.columns) in unique_columns:
+                continue
+            index.create(db.engine)
+
+
 def setup_db():
     """สร้างฐานข้อมูลและตาราง รวมถึงข้อมูลเริ่มต้น"""
     with app.app_context():
@@ -73,37 +219,39 @@ def setup_db():
             print("Running in Production/Render mode with PostgreSQL. Skipping initial data creation.")
             # ใน Production เราจะสร้างตารางเสมอ แต่จะไม่สร้างข้อมูลเริ่มต้นซ้ำทุกครั้งที่รัน
             db.create_all()
+            create_indexes()
         else:
             # สำหรับ Localhost/SQLite
-            if not os.path.exists(app.config['UPLOAD_FOLDER']):
-                os.makedirs(app.config['UPLOAD_FOLDER'])
-
             db.create_all() 
+            create_indexes()
             print("✅ Database tables created successfully (Local SQLite)!")
             
             # สร้างข้อมูลเริ่มต้น (ถ้ายังไม่มีชั้นเรียน)
-            if Class.query.count() == 0:
-                class1 = Class(name='คณิตศาสตร์ ม.3/1', join_code=secrets.token_hex(3).upper())
+            if db.session.query(Class.id).first() is None:
+                class1 = Class(name='คณิตศาสตร์ ม.3/1', join_code=os.urandom(3).hex().upper())
                 db.session.add(class1)
-                db.session.commit()
-                
-                assignment1 = Assignment(
-                    title='แบบฝึกหัดเรื่อง พีทาโกรัส',
-                    description='ส่งไฟล์ PDF ที่แสดงวิธีการคำนวณที่ถูกต้อง',
-                    file_link='https://docs.google.com/document/d/example_pythagoras_link', 
-                    max_score=20,
-                    due_date=datetime.strptime('2025-12-15 23:59', '%Y-%m-%d %H:%M'),
-                    class_id=class1.id
-                )
-                assignment2 = Assignment(
-                    title='โจทย์ปัญหาเชิงซ้อน',
-                    description='ส่งงานเขียนด้วยลายมือเท่านั้น',
-                    file_link='https://example.com/complex_problems.pdf', 
-                    max_score=50,
-                    due_date=datetime.strptime('2025-11-20 18:00', '%Y-%m-%d %H:%M'),
-                    class_id=class1.id
-                )
-                db.session.add_all([assignment1, assignment2])
+                # flush เพื่อให้ได้ class1.id โดยยังไม่ต้อง commit
+                db.session.flush()
+
+                # เพิ่มงานมอบหมายทั้งหมดด้วย INSERT ครั้งเดียว (bulk insert)
+                db.session.execute(insert(Assignment), [
+                    dict(
+                        title='แบบฝึกหัดเรื่อง พีทาโกรัส',
+                        description='ส่งไฟล์ PDF ที่แสดงวิธีการคำนวณที่ถูกต้อง',
+                        file_link='https://docs.google.com/document/d/example_pythagoras_link', 
+                        max_score=20,
+                        due_date=datetime(2025, 12, 15, 23, 59),
+                        class_id=class1.id
+                    ),
+                    dict(
+                        title='โจทย์ปัญหาเชิงซ้อน',
+                        description='ส่งงานเขียนด้วยลายมือเท่านั้น',
+                        file_link='https://example.com/complex_problems.pdf', 
+                        max_score=50,
+                        due_date=datetime(2025, 11, 20, 18, 0),
+                        class_id=class1.id
+                    ),
+                ])
                 db.session.commit()
                 print(f"✅ สร้างชั้นเรียน '{class1.name}' และ 2 ชิ้นงานเรียบร้อยแล้ว")
             else:
@@ -112,9 +260,14 @@ def setup_db():
 # --- Routes (Teacher Side) ---
 
 @app.route('/teacher')
+@cache.cached(timeout=60, key_prefix=DASHBOARD_CACHE_KEY, unless=skip_dashboard_cache)
 def teacher_dashboard():
     """หน้า Dashboard หลักของครู แสดงรายการชั้นเรียนและงานมอบหมายทั้งหมด"""
-    classes = Class.query.order_by(Class.id).all()
+    # โหลดงานมอบหมายและงานที่ส่งมาล่วงหน้าด้วย selectinload (ป้องกันปัญหา N+1 query ใน template)
+    classes = strict(
+        Class.query,
+        selectinload(Class.assignments).selectinload(Assignment.submissions)
+    ).order_by(Class.id).all()
     return render_template('teacher_dashboard.html', classes=classes)
 
 @app.route('/manage_classes', methods=['GET', 'POST'])
@@ -126,34 +279,36 @@ def manage_classes():
         if action == 'add':
             class_name = request.form.get('class_name')
             if class_name:
-                new_join_code = secrets.token_hex(3).upper() 
+                new_join_code = os.urandom(3).hex().upper() 
                 new_class = Class(name=class_name, join_code=new_join_code)
                 db.session.add(new_class)
                 db.session.commit()
+                invalidate_dashboard()
                 flash(f'✅ สร้างชั้นเรียน "{class_name}" เรียบร้อยแล้ว รหัสเข้าร่วม: {new_join_code}', 'success')
             else:
                 flash('❌ กรุณากรอกชื่อชั้นเรียน', 'error')
         
         elif action == 'delete':
-            class_id_to_delete = request.form.get('class_id_to_delete')
-            class_to_delete = Class.query.get(class_id_to_delete)
+            class_id_to_delete = request.form.get('class_id_to_delete', type=int)
+            class_to_delete = db.session.get(Class, class_id_to_delete) if class_id_to_delete else None
             if class_to_delete:
                 db.session.delete(class_to_delete)
                 db.session.commit()
+                _join_code_cache.pop(class_to_delete.join_code, None)
+                invalidate_dashboard()
                 flash(f'🗑️ ลบชั้นเรียน "{class_to_delete.name}" และข้อมูลที่เกี่ยวข้องทั้งหมดเรียบร้อยแล้ว', 'warning')
             else:
                 flash('❌ ไม่พบชั้นเรียนที่ต้องการลบ', 'error')
 
         return redirect(url_for('manage_classes'))
 
-    classes = Class.query.order_by(Class.id).all()
+    classes = strict(Class.query, selectinload(Class.assignments)).order_by(Class.id).all()
     return render_template('manage_classes.html', classes=classes)
 
 
 @app.route('/add_assignment', methods=['GET', 'POST'])
 def add_assignment():
     """หน้าสำหรับเพิ่มงานมอบหมายใหม่"""
-    classes = Class.query.all()
     if request.method == 'POST':
         title = request.form.get('title')
         description = request.form.get('description')
@@ -167,7 +322,8 @@ def add_assignment():
             return redirect(url_for('add_assignment'))
 
         try:
-            due_date = datetime.strptime(due_date_str, '%Y-%m-%dT%H:%M') if due_date_str else None
+            # ค่าจาก <input type="datetime-local"> อยู่ในรูปแบบ ISO 8601 (YYYY-MM-DDTHH:MM)
+            due_date = datetime.fromisoformat(due_date_str) if due_date_str else None
             
             new_assignment = Assignment(
                 title=title,
@@ -179,23 +335,27 @@ def add_assignment():
             )
             db.session.add(new_assignment)
             db.session.commit()
+            invalidate_dashboard()
             flash(f'✅ สร้างงานมอบหมาย "{title}" เรียบร้อยแล้ว', 'success')
             return redirect(url_for('teacher_dashboard'))
         except Exception as e:
             db.session.rollback()
             flash(f'❌ เกิดข้อผิดพลาดในการสร้างงาน: {e}', 'error')
-            
+
+    # ดึงเฉพาะคอลัมน์ที่ใช้ใน dropdown (ไม่ต้องสร้าง ORM Object ทั้งแถว)
+    classes = db.session.query(Class.id, Class.name, Class.join_code).order_by(Class.id).all()
     return render_template('add_assignment.html', classes=classes)
 
 
 @app.route('/delete_assignment/<int:assignment_id>', methods=['POST'])
 def delete_assignment(assignment_id):
     """ลบงานมอบหมายและงานที่ส่งมาทั้งหมดที่เกี่ยวข้อง"""
-    assignment_to_delete = Assignment.query.get_or_404(assignment_id)
+    assignment_to_delete = db.get_or_404(Assignment, assignment_id)
     
     try:
         db.session.delete(assignment_to_delete)
         db.session.commit()
+        invalidate_dashboard()
         flash(f'🗑️ ลบงานมอบหมาย "{assignment_to_delete.title}" และงานที่ส่งมาทั้งหมดเรียบร้อยแล้ว', 'warning')
     except Exception as e:
         db.session.rollback()
@@ -207,8 +367,8 @@ def delete_assignment(assignment_id):
 @app.route('/view_submissions/<int:assignment_id>')
 def view_submissions(assignment_id):
     """หน้าสำหรับครูดูรายการงานที่ส่งมาและให้คะแนน"""
-    assignment = Assignment.query.get_or_404(assignment_id)
-    submissions = Submission.query.filter_by(assignment_id=assignment_id).order_by(Submission.submitted_at.desc()).all()
+    assignment = strict(Assignment.query, joinedload(Assignment.class_rel)).filter_by(id=assignment_id).first_or_404()
+    submissions = strict(Submission.query).filter_by(assignment_id=assignment_id).order_by(Submission.submitted_at.desc()).all()
     
     return render_template('view_submissions.html', assignment=assignment, submissions=submissions)
 
@@ -216,7 +376,8 @@ def view_submissions(assignment_id):
 @app.route('/grade_submission/<int:submission_id>', methods=['POST'])
 def grade_submission(submission_id):
     """ประมวลผลการให้คะแนนงานที่ส่งมา"""
-    submission = Submission.query.get_or_404(submission_id)
+    # โหลดงานมอบหมายมาพร้อมกันใน query เดียว (ใช้ตรวจสอบคะแนนเต็ม)
+    submission = db.get_or_404(Submission, submission_id, options=[joinedload(Submission.assignment_rel)])
     
     try:
         score = request.form.get('score', type=int)
@@ -239,12 +400,13 @@ def grade_submission(submission_id):
 @app.route('/view_file/<filename>')
 def view_file(filename):
     """อนุญาตให้ครูดาวน์โหลดหรือเปิดดูไฟล์ที่ส่งมา"""
-    # ตรวจสอบเพื่อป้องกันการโจมตี Directory Traversal
-    if '..' in filename or filename.startswith('/'):
+    # ตรวจสอบเพื่อป้องกันการโจมตี Directory Traversal (safe_join ปฏิเสธทั้ง path แบบ absolute และ ..)
+    if safe_join(app.config['UPLOAD_FOLDER'], filename) is None:
         abort(404)
     # **ข้อควรระวัง:** ใน Production/Render ต้องใช้บริการจัดเก็บไฟล์ภายนอก (เช่น S3) 
     # แต่สำหรับ Render/Heroku ฟรี จะยังคงใช้ File System ได้
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # ชื่อไฟล์มีรหัสสุ่มและไม่ถูกเขียนทับ จึงให้ browser แคชได้ และรองรับ conditional GET (ETag/304)
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, conditional=True, max_age=3600)
 
 
 # --- Routes (Student Side) ---
@@ -252,6 +414,7 @@ def view_file(filename):
 # หน้าแรกสำหรับนักเรียน (กรอกรหัสเข้าร่วม)
 @app.route('/')
 @app.route('/student_landing', methods=['GET'])
+@cache.cached(timeout=300, unless=has_pending_flashes)
 def student_landing():
     """หน้าแรกสำหรับนักเรียน เพื่อกรอกรหัสเข้าร่วม"""
     return render_template('student_landing.html')
@@ -266,14 +429,14 @@ def student_view_assignments():
         flash('❌ กรุณากรอกรหัสเข้าร่วม', 'error')
         return redirect(url_for('student_landing'))
 
-    class_obj = Class.query.filter_by(join_code=join_code).first()
+    class_obj = lookup_class_by_join_code(join_code)
     
     if not class_obj:
         flash('❌ ไม่พบรหัสเข้าร่วมนี้', 'error')
         return redirect(url_for('student_landing'))
     
     # ดึงงานมอบหมายทั้งหมดในชั้นเรียนนี้
-    assignments = Assignment.query.filter_by(class_id=class_obj.id).order_by(Assignment.due_date.desc()).all()
+    assignments = strict(Assignment.query).filter_by(class_id=class_obj.id).order_by(Assignment.due_date.desc()).all()
     
     return render_template('list_assignments.html', 
                            class_info=class_obj, 
@@ -284,13 +447,13 @@ def student_view_assignments():
 def submission_form(assignment_id):
     """หน้าฟอร์มสำหรับนักเรียนใช้ส่งงาน"""
     
-    assignment = Assignment.query.get(assignment_id)
+    assignment = strict(Assignment.query, joinedload(Assignment.class_rel)).filter_by(id=assignment_id).first()
 
     if not assignment:
         flash('❌ ไม่พบงานมอบหมายนี้', 'error')
         return redirect(url_for('student_landing')) 
 
-    # โหลด Class Object ผ่าน backref 'class_rel'
+    # Class Object ถูกโหลดมาพร้อมกันแล้วด้วย joinedload
     class_obj = assignment.class_rel 
 
     return render_template('submission_form.html', assignment=assignment, class_info=class_obj)
@@ -299,7 +462,8 @@ def submission_form(assignment_id):
 @app.route('/submit_submission/<int:assignment_id>', methods=['POST'])
 def submit_submission(assignment_id):
     """ประมวลผลการส่งงานของนักเรียน"""
-    assignment = Assignment.query.get_or_404(assignment_id)
+    # db.get_or_404 ตรวจสอบใน identity map ก่อน จึงไม่ต้อง query ซ้ำหากโหลดไว้แล้ว
+    assignment = db.get_or_404(Assignment, assignment_id)
     
     student_name = request.form.get('student_name')
     if not student_name or 'file' not in request.files:
@@ -318,15 +482,11 @@ def submit_submission(assignment_id):
         file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else 'dat'
         
         # สร้างชื่อไฟล์ที่ไม่ซ้ำกันเพื่อเก็บในเซิร์ฟเวอร์
-        unique_filename = f"{secure_filename(student_name)[:20]}_{assignment_id}_{secrets.token_hex(4)}.{file_extension}"
+        unique_filename = f"{sanitize_name(student_name)}_{assignment_id}_{os.urandom(4).hex()}.{file_extension}"
 
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
         
-        # ตรวจสอบว่ามีโฟลเดอร์สำหรับเก็บไฟล์หรือไม่
-        if not os.path.exists(app.config['UPLOAD_FOLDER']):
-            os.makedirs(app.config['UPLOAD_FOLDER'])
-            
-        file.save(filepath)
+        save_upload(file, filepath)
         
         # ตรวจสอบว่ามีการส่งงานนี้มาแล้วหรือไม่ (ใช้ชื่อนักเรียนและ ID งานมอบหมาย)
         # หากต้องการให้ส่งซ้ำได้ ให้ข้ามส่วนนี้
@@ -338,6 +498,7 @@ def submit_submission(assignment_id):
         )
         db.session.add(new_submission)
         db.session.commit()
+        invalidate_dashboard()
 
         flash(f'✅ ส่งงาน "{assignment.title}" เรียบร้อยแล้ว', 'success')
         return redirect(url_for('submission_form', assignment_id=assignment_id))
@@ -352,4 +513,5 @@ if __name__ == '__main__':
     # ใช้ os.environ.get('PORT') สำหรับ Production Environment
     port = int(os.environ.get('PORT', 5000))
     # ใน Production ต้องใช้ Host 0.0.0.0
-    app.run(debug=True, host='0.0.0.0', port=port)
+    # โหมด debug เปิดได้เฉพาะเมื่อกำหนด FLASK_DEBUG=1 (Flask อ่านค่านี้ให้ผ่าน app.debug)
+    app.run(debug=app.debug, host='0.0.0.0', port=port)
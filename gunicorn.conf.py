@@ -0,0 +1,23 @@
+# ตั้งค่า Gunicorn สำหรับ Production (Render)
+import os
+
+# ใช้ Environment Variable (PORT) ที่ Render กำหนดให้
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 3))
+
+# โหลดแอปครั้งเดียวใน master process แล้วแชร์ให้ทุก worker (copy-on-write)
+preload_app = True
+
+
+def post_fork(server, worker):
+    """ทิ้ง connection pool ที่สืบทอดมาจาก master เพื่อไม่ให้ worker ใช้ connection ร่วมกัน"""
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def on_starting(server):
+    """สร้าง Index ที่ยังไม่มีในฐานข้อมูลครั้งเดียวใน master process ก่อนเริ่ม worker"""
+    from app import app, create_indexes
+    with app.app_context():
+        create_indexes()